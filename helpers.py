@@ -0,0 +1,177 @@
+"""Parsing and OCR helpers shared by the app and its worker processes"""
+import os
+import io
+import re
+import subprocess
+import pdfplumber
+import pandas as pd
+import pdf2image
+import pytesseract
+from PIL import Image
+import numpy as np
+
+# Date pattern (DD/MM/YY or DD/MM/YYYY)
+_DATE_RE = re.compile(r'(\d{2}/\d{2}/(?:\d{4}|\d{2}))')
+# Transaction line: date, description, then the amount (numbers with
+# optional decimals and commas) at the end of the line. The currency
+# prefix stays outside the Amount group so its dot is not read as a
+# decimal point; a minus sign or a trailing Cr marks a credit.
+_TRANSACTION_RE = re.compile(
+    r'(?P<Date>\d{2}/\d{2}/(?:\d{4}|\d{2}))\s+(?P<Description>.+?)\s+'
+    r'(?P<Sign>-)?(?:Rs\.?|₹)?\s*(?P<Amount>-?[\d,]+(?:\.\d{1,2})?)'
+    r'(?:\s*(?P<Marker>(?i:cr|dr)))?\s*$'
+)
+# Whitespace within a line, and whitespace around line breaks
+_WS_RE = re.compile(r'[^\S\n]+')
+_LINE_BREAK_RE = re.compile(r'[^\S\n]*\n[^\S\n]*')
+# Anything that is not part of a plain number
+AMT_CLEAN_RE = re.compile(r'[^\d.\-]')
+
+# Tesseract engine and page segmentation mode
+OCR_CONFIG = ['--oem', '3', '--psm', '6']
+
+def _prepare_image(image):
+    """Binarize a grayscale page image for OCR"""
+    # Apply threshold to make text more clear
+    threshold = 200
+    pixels = np.asarray(image)
+    return Image.fromarray(np.where(pixels > threshold, np.uint8(255), np.uint8(0)), mode='L')
+
+def extract_text_from_images(images):
+    """Extract text from a batch of page images using a single OCR run"""
+    pages = [_prepare_image(image) for image in images]
+    # Ship all pages to Tesseract as one multi-page TIFF so the process
+    # start-up and model load are paid once per batch, not once per page
+    buf = io.BytesIO()
+    pages[0].save(buf, format='TIFF', save_all=True, append_images=pages[1:], compression='tiff_lzw')
+    result = subprocess.run(
+        [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', *OCR_CONFIG],
+        input=buf.getvalue(), capture_output=True, check=True,
+    )
+    # Tesseract ends every page with a form feed
+    return result.stdout.decode('utf-8').split('\x0c')[:len(images)]
+
+# 'auto' reads the text layer and falls back to OCR for scanned pages,
+# 'digital' never runs OCR and 'ocr' ignores the text layer
+EXTRACTION_MODES = ('auto', 'digital', 'ocr')
+
+# Statement text is legible at 150 DPI; pages whose OCR text shows a
+# date but yields no parseable transaction are OCR'd again at the retry DPI
+OCR_DPI = 150
+OCR_RETRY_DPI = 300
+
+# Pages with fewer alphanumeric characters than this are treated as scanned
+MIN_TEXT_LAYER_CHARS = 20
+
+def get_max_workers():
+    """Number of worker processes used for per-page extraction"""
+    return os.cpu_count() or 1
+
+def _parse_text(text):
+    """Parse all transaction lines from a block of text into a DataFrame"""
+    # Clean all lines in one pass over the page
+    text = _WS_RE.sub(' ', _LINE_BREAK_RE.sub('\n', text)).strip()
+    # Match every line with one compiled pattern instead of a Python loop
+    lines = pd.Series(text.split('\n'), dtype='string')
+    df = lines.str.extract(_TRANSACTION_RE).dropna(subset=['Date'])
+    # Credits (payments, refunds) are returned as negative amounts
+    amount = df['Amount'].str.lstrip('-')
+    credit = (
+        df['Amount'].str.startswith('-')
+        | df['Sign'].notna()
+        | (df['Marker'].str.lower() == 'cr')
+    ).fillna(False).astype(bool)
+    df['Amount'] = amount.where(~credit, '-' + amount)
+    return df[['Date', 'Description', 'Amount']]
+
+def _has_text_layer(text):
+    """Check whether pdfplumber found a usable digital text layer"""
+    return sum(c.isalnum() for c in text) > MIN_TEXT_LAYER_CHARS
+
+def _extract_from_digital_page(page, text):
+    """Extract transactions from a page with a digital text layer
+
+    ``text`` is the page's already-extracted text, reused for the fallback.
+    """
+    # Every transaction has a date, so pages without one need no table search
+    if not _DATE_RE.search(text):
+        return _parse_text('')
+    rows = [
+        # Wrapped cells contain line breaks; keep each row on one line
+        ' '.join(cell.replace('\n', ' ') for cell in row if cell)
+        for table in page.extract_tables()
+        for row in table
+    ]
+    df = _parse_text('\n'.join(rows))
+    # Fall back to the raw text when no table was detected
+    if df.empty:
+        df = _parse_text(text)
+    return df
+
+def init_ocr_worker():
+    """Keep Tesseract single-threaded so it does not compete with the pool"""
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+def _page_runs(page_numbers):
+    """Group sorted page numbers into (first, last) runs of consecutive pages"""
+    runs = []
+    for i in page_numbers:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return runs
+
+def _ocr_pages(path, page_numbers, dpi):
+    """Render and OCR the given pages, returning (page number, text, DataFrame) triples"""
+    # Convert only the requested pages, rendered by Poppler in grayscale.
+    # Each run of consecutive pages is rendered by one pdftoppm process
+    images = []
+    for first, last in _page_runs(page_numbers):
+        images.extend(pdf2image.convert_from_path(path, dpi=dpi, first_page=first, last_page=last, grayscale=True))
+    texts = extract_text_from_images(images)
+    return [(i, text, _parse_text(text)) for i, text in zip(page_numbers, texts)]
+
+def _needs_ocr_retry(text, df):
+    """Check whether a page's OCR text looks like a misread transaction list
+
+    Pages without any date (covers, summaries, terms, blank pages) are not
+    retried: a higher resolution would not produce transactions for them.
+    """
+    return df.empty and _DATE_RE.search(text) is not None
+
+def extract_pages(path, page_numbers, strategy='auto'):
+    """Extract transactions for a block of pages of the PDF at ``path``
+
+    Runs in a worker process; only the requested pages are opened, so no
+    pdfplumber objects need to be pickled. ``strategy`` is one of
+    EXTRACTION_MODES. Returns one DataFrame per page, in page order.
+    """
+    page_rows = {}
+    scanned_pages = []
+    
+    if strategy == 'ocr':
+        scanned_pages = list(page_numbers)
+    else:
+        # Digital pages are parsed directly; only image-only pages need OCR
+        with pdfplumber.open(path, pages=page_numbers) as pdf:
+            for page in pdf.pages:
+                text = page.extract_text() or ''
+                if strategy == 'digital' or _has_text_layer(text):
+                    page_rows[page.page_number] = _extract_from_digital_page(page, text)
+                else:
+                    scanned_pages.append(page.page_number)
+    
+    if scanned_pages:
+        retry_pages = []
+        for i, text, df in _ocr_pages(path, scanned_pages, OCR_DPI):
+            page_rows[i] = df
+            if _needs_ocr_retry(text, df):
+                retry_pages.append(i)
+        # Retry pages that were unreadable at the reduced resolution
+        if retry_pages:
+            for i, _, df in _ocr_pages(path, retry_pages, OCR_RETRY_DPI):
+                if len(df) > len(page_rows[i]):
+                    page_rows[i] = df
+    
+    return [page_rows[i] for i in page_numbers]
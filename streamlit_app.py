@@ -2,116 +2,119 @@ import streamlit as st
 import pdfplumber
 import pandas as pd
 import io
-import base64
-import re
-import pdf2image
-import pytesseract
-from PIL import Image
-import numpy as np
+import os
+import math
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import xlsxwriter
+from helpers import AMT_CLEAN_RE, EXTRACTION_MODES, get_max_workers, init_ocr_worker, extract_pages
 
-def extract_text_from_image(image):
-    """Extract text from image using OCR"""
-    # Increase image resolution for better OCR
-    image = image.convert('L')  # Convert to grayscale
-    # Apply threshold to make text more clear
-    threshold = 200
-    image = image.point(lambda p: p > threshold and 255)
-    # Extract text using OCR
-    custom_config = r'--oem 3 --psm 6'
-    text = pytesseract.image_to_string(image, config=custom_config)
-    return text
+# Cached statements hold users' financial data, so keep only a few recent
+# ones and drop them after ten minutes
+CACHE_MAX_ENTRIES = 8
+CACHE_TTL = 600
 
-def parse_transaction_line(line):
-    """Parse a single line of transaction"""
-    # Match date pattern (DD/MM/YY or DD/MM/YYYY)
-    date_pattern = r'(\d{2}/\d{2}/(?:\d{2}|\d{4}))'
-    # Match amount pattern (numbers with optional decimals and commas)
-    amount_pattern = r'((?:Rs\.?|₹)?\s*[\d,]+\.?\d{0,2})'
-    
-    date_match = re.search(date_pattern, line)
-    amount_match = re.search(amount_pattern, line)
-    
-    if date_match and amount_match:
-        date = date_match.group(1)
-        amount = amount_match.group(1)
-        # Description is everything between date and amount
-        description = line[date_match.end():amount_match.start()].strip()
-        return [date, description, amount]
-    return None
+def extract_from_pdf(data, strategy):
+    """Extract data from PDF using the given extraction strategy
 
-def extract_from_scanned_pdf(pdf_file):
-    """Extract data from scanned PDF using OCR"""
-    all_data = []
-    
+    Errors propagate so a failed run is not cached by load_statement.
+    """
+    # Workers open the PDF from disk by path instead of receiving pages
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
+        tmp.write(data)
     try:
-        # Convert PDF to images
-        images = pdf2image.convert_from_bytes(pdf_file.read())
+        with pdfplumber.open(tmp.name) as pdf:
+            page_numbers = [page.page_number for page in pdf.pages]
         
-        for image in images:
-            # Extract text from image
-            text = extract_text_from_image(image)
-            lines = text.split('\n')
-            
-            for line in lines:
-                # Clean the line
-                line = ' '.join(line.split()).strip()
-                if line:
-                    # Try to parse transaction
-                    transaction = parse_transaction_line(line)
-                    if transaction:
-                        all_data.append(transaction)
+        # Extract contiguous blocks of pages in worker processes so each
+        # worker pays the start-up cost once; results keep page order
+        workers = max(1, min(get_max_workers(), len(page_numbers)))
+        chunk_size = max(1, math.ceil(len(page_numbers) / workers))
+        chunks = [page_numbers[i:i + chunk_size] for i in range(0, len(page_numbers), chunk_size)]
+        if len(chunks) == 1:
+            # A single block gains nothing from a pool; skip its start-up cost
+            blocks = [extract_pages(tmp.name, chunks[0], strategy)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_ocr_worker) as executor:
+                blocks = list(executor.map(extract_pages, repeat(tmp.name), chunks, repeat(strategy)))
+    finally:
+        os.unlink(tmp.name)
     
-        if not all_data:
-            return None
-            
-        # Create DataFrame
-        df = pd.DataFrame(all_data, columns=['Date', 'Description', 'Amount'])
-        return df
+    frames = list(chain.from_iterable(blocks))
+    if not frames:
+        return None
     
-    except Exception as e:
-        st.error(f"Error in OCR processing: {str(e)}")
+    df = pd.concat(frames, ignore_index=True)
+    if df.empty:
         return None
+    return df
 
 def process_credit_card_bill(df):
     """Process the extracted data"""
     if df is None or df.empty:
         return None
         
-    # Remove any empty rows
-    df = df.dropna(how='all')
-    
     # Clean up date format
     try:
-        df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
-        # If above fails, try with 2-digit year
-        mask = df['Date'].isna()
-        df.loc[mask, 'Date'] = pd.to_datetime(df.loc[mask, 'Date'], format='%d/%m/%y', errors='coerce')
-        df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+        # Statements repeat a handful of dates, so convert each distinct one once
+        unique_dates = df['Date'].drop_duplicates()
+        # Dates that are not DD/MM/YYYY fall back to the 2-digit year
+        dates = pd.to_datetime(unique_dates, format='%d/%m/%Y', errors='coerce')
+        dates = dates.fillna(pd.to_datetime(unique_dates, format='%d/%m/%y', errors='coerce'))
+        df['Date'] = df['Date'].map(dict(zip(unique_dates, dates.dt.strftime('%Y-%m-%d'))))
     except:
         pass
     
     # Clean up amount format
-    df['Amount'] = df['Amount'].replace(r'[^\d.-]', '', regex=True)
-    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+    df['Amount'] = pd.to_numeric(df['Amount'].astype('string').str.replace(AMT_CLEAN_RE, '', regex=True), errors='coerce')
     
     # Remove rows where date or amount is invalid
     df = df.dropna(subset=['Date', 'Amount'])
     
     return df
 
-def get_download_link(df, format_type):
-    """Generate a download link for the processed file"""
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_statement(fingerprint, strategy, _data):
+    """Extract, process and summarize a statement
+
+    Returns None when no transactions were extracted, otherwise
+    (df, number of transactions, total amount, preview rows), cached on
+    the upload fingerprint so reruns only render the stored results.
+    Extraction errors are raised rather than cached, so a re-upload retries.
+    """
+    df = extract_from_pdf(_data, strategy)
+    if df is None or df.empty:
+        return None
+    
+    df = process_credit_card_bill(df)
+    if df is None or df.empty:
+        return df, 0, 0.0, None
+    return df, len(df), float(df['Amount'].sum()), df.head()
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def get_download_file(fingerprint, strategy, format_type, _df):
+    """Generate the processed file as (data, file name, MIME type)"""
     if format_type == 'Excel':
         output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False)
-        excel_data = output.getvalue()
-        b64 = base64.b64encode(excel_data).decode()
-        return f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="processed_bill.xlsx">Download Excel File</a>'
+        # constant_memory streams each row out as soon as the next one starts,
+        # so rows are written in order rather than through DataFrame.to_excel,
+        # which fills the sheet column by column
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, _df.columns)
+        for row_idx, row in enumerate(_df.itertuples(index=False), start=1):
+            worksheet.write_row(row_idx, 0, row)
+        workbook.close()
+        return output.getvalue(), 'processed_bill.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     else:
-        csv = df.to_csv(index=False)
-        b64 = base64.b64encode(csv.encode()).decode()
-        return f'<a href="data:file/csv;base64,{b64}" download="processed_bill.csv">Download CSV File</a>'
+        output = io.BytesIO()
+        # pyarrow writes UTF-8 straight into the buffer, with no intermediate str
+        pa_csv.write_csv(pa.Table.from_pandas(_df, preserve_index=False), output)
+        return output.getvalue(), 'processed_bill.csv', 'text/csv'
 
 def main():
     st.set_page_config(page_title="Credit Card Bill Processor", page_icon="💳")
@@ -125,31 +128,34 @@ def main():
     # Format selection
     format_type = st.radio("Select output format:", ('Excel', 'CSV'))
     
+    # Extraction mode selection
+    strategy = st.selectbox("Extraction mode:", EXTRACTION_MODES)
+    
     if uploaded_file is not None:
         try:
             with st.spinner('Processing PDF... This may take a minute for scanned documents...'):
-                # Try OCR extraction for scanned PDFs
-                df = extract_from_scanned_pdf(uploaded_file)
+                # Read the upload once, independent of the stream position, and
+                # share the same bytes for fingerprinting and extraction
+                data = uploaded_file.getvalue()
+                fingerprint = hashlib.sha256(data).hexdigest()
+                statement = load_statement(fingerprint, strategy, data)
                 
-                if df is not None and not df.empty:
-                    df = process_credit_card_bill(df)
+                if statement is not None:
+                    df, num_transactions, total_amount, preview = statement
                     
-                    if df is not None and not df.empty:
+                    if num_transactions:
                         # Show preview
                         st.subheader("Preview of extracted data:")
-                        st.dataframe(df.head())
+                        st.dataframe(preview)
                         
                         # Download button
-                        st.markdown(get_download_link(df, format_type), unsafe_allow_html=True)
+                        file_data, file_name, mime = get_download_file(fingerprint, strategy, format_type, df)
+                        st.download_button(f"Download {format_type} File", data=file_data, file_name=file_name, mime=mime)
                         
                         # Display statistics
                         st.subheader("Summary Statistics:")
-                        num_transactions = len(df)
                         st.write(f"Total number of transactions: {num_transactions}")
-                        
-                        if 'Amount' in df.columns:
-                            total_amount = df['Amount'].sum()
-                            st.write(f"Total amount: ₹{total_amount:,.2f}")
+                        st.write(f"Total amount: ₹{total_amount:,.2f}")
                     else:
                         st.error("Could not process the extracted data. Please check if the PDF contains valid transaction data.")
                 else: